@@ -1,90 +1,288 @@
+import argparse
+import hashlib
 import json
 import logging
 import os
+import shutil
 import sys
+import threading
 import time
-from typing import Tuple, List, Optional, Any, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from types import MappingProxyType
+from typing import Tuple, List, Optional, Any, Dict, Callable
 from urllib.parse import urlencode
 
-import requests
+import httpx
 from dotenv import load_dotenv
-from rich.console import Console
+from rich.console import Console, Group
 from rich.progress import track
 from rich.prompt import Prompt
 
+try:
+    import orjson
+
+    def _dumps(obj: Any, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+except ImportError:
+    def _dumps(obj: Any, indent: bool = False) -> bytes:
+        return json.dumps(obj, indent=2 if indent else None).encode()
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+try:
+    import brotli  # noqa: F401 - lets httpx decode brotli-compressed responses
+
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger("httpx").setLevel(logging.WARNING)  # Per-request logs would interrupt the progress bar
 
 console = Console()
 
 SAVED_SEARCHES_DIR = "saved_searches"
+CACHE_DIR = "cache"
+CACHE_TTL = 7 * 24 * 60 * 60  # Seconds before a cached API response is fetched again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled on each further attempt
+ANIMATE = os.getenv("CDFETCH_ANIMATE") == "1"
 
 
 def clear_screen():
-    if sys.platform.startswith('win'):
-        os.system('cls')  # For Windows
-    else:
-        os.system('clear')  # For Unix/Linux/macOS
+    console.clear()  # Rich emits the right escape sequence for the terminal, no subprocess needed
 
 
 def animate_text(text: str, color: str = 'green', delay: float = 0.05):
+    style = f'bold {color}'
+    if not ANIMATE:
+        console.print(text, style=style)
+        return
+
+    # Render the style's escape codes around a placeholder once, then type out the characters between them
+    # without going through Rich per glyph. The placeholder keeps highlighting and wrapping out of the way
+    with console.capture() as capture:
+        console.print("X", style=style, end='', highlight=False, markup=False, emoji=False, soft_wrap=True)
+    prefix, _, suffix = capture.get().partition("X")
+
+    console.file.write(prefix)
     for char in text:
-        console.print(char, end='', style=f'bold {color}')
+        console.file.write(char)
+        console.file.flush()
         time.sleep(delay)
-    console.print()
+    console.file.write(f"{suffix}\n")
+    console.file.flush()
+
+
+class RateLimiter:
+    """Thread-safe sliding-window limiter allowing at most `max_calls` calls per `period` seconds."""
+
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=max_calls)
+
+    def wait(self):
+        # Only blocks once the window is full, and only until its oldest call expires
+        with self._lock:
+            if len(self._calls) == self.max_calls:
+                wait_time = self._calls[0] + self.period - time.monotonic()
+                if wait_time > 0:
+                    time.sleep(wait_time)
+            self._calls.append(time.monotonic())
+
+
+class GrantsWriter:
+    """Streams grant rows into a newline-delimited JSON file, one grant per line."""
+
+    def __init__(self, output_file: str, append: bool = False):
+        self.output_file = output_file
+        self.append = append
+        self.count = 0
+        self._file = None
+
+    def __enter__(self) -> "GrantsWriter":
+        self._file = open(self.output_file, "ab" if self.append else "wb")
+        return self
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        self._file.write(b"".join(_dumps(row) + b"\n" for row in rows))
+        self.count += len(rows)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        if exc_type is None:
+            console.print(f"[bold green]Grants data saved to {self.output_file}[/bold green]")
 
 
 class GrantFetcher:
-    def __init__(self, api_key: str, delay: float = 60 / 9):
+    # Query parameters shared by every search, encoded once when the class is defined
+    _BASE_PARAMS = MappingProxyType({
+        "include_gov": "yes",
+        "sort_by": "year_issued",
+        "sort_order": "desc",
+        "format": "json"
+    })
+    _BASE_QUERY = urlencode(_BASE_PARAMS)
+
+    def __init__(self, api_key: str, rate_limit: int = 9, rate_period: float = 60, max_workers: int = 4,
+                 cache_dir: Optional[str] = CACHE_DIR, cache_ttl: float = CACHE_TTL, per_page: Optional[int] = None,
+                 max_retries: int = 3, client: Optional[httpx.Client] = None):
         self.api_key = api_key
-        self.delay = delay
+        self.max_workers = max_workers
+        self.per_page = per_page
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.max_retries = max_retries
         self.base_url = "https://api.candid.org/grants/v1/transactions"
-
-    def get_grants_transactions(self, page_number: int, year_range: Tuple[Optional[int], Optional[int]],
-                                dollar_range: Tuple[Optional[int], Optional[int]], subjects: List[str],
-                                populations: List[str], locations: List[str], support_strategies: List[str]) -> Dict[
-                                str, Any]:
-        params = self._build_query_params(page_number, year_range, dollar_range, subjects, populations, locations,
-                                          support_strategies)
-        url = f"{self.base_url}?{urlencode(params)}"
-        headers = {
+        self.headers = {
             "accept": "application/json",
-            "Subscription-Key": self.api_key
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Subscription-Key": api_key
         }
+        self._encoding_logged = False
+        self._encoding_lock = threading.Lock()
+        self.client = client if client is not None else self._create_client(max_workers, max_retries)
+        self.rate_limiter = RateLimiter(rate_limit, rate_period)
+
+    @staticmethod
+    def _create_client(max_connections: int, max_retries: int) -> httpx.Client:
+        # HTTP/2 lets concurrent page requests share one kept-alive connection
+        transport = httpx.HTTPTransport(
+            http2=True,
+            retries=max_retries,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=1, keepalive_expiry=300)
+        )
+        return httpx.Client(transport=transport, timeout=httpx.Timeout(30.0, connect=10.0))
+
+    def _request(self, url: str) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()  # Every attempt counts against the API rate limit
+            response = self.client.get(url, headers=self.headers)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(response, attempt))
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        # Honor the server's Retry-After (seconds or an HTTP date); retrying sooner would just be throttled again
+        delay = RETRY_BACKOFF * 2 ** attempt
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    delay = max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+
+        # One rate limit window is the longest wait that can help; anything longer would stall the whole run
+        max_delay = self.rate_limiter.period
+        if delay > max_delay:
+            logging.warning(f"Server asked to retry after {delay:.0f}s; waiting {max_delay:.0f}s instead")
+            delay = max_delay
+        return delay
+
+    def get_grants_transactions(self, page_number: int, search_query: str) -> Dict[str, Any]:
+        url = f"{self.base_url}?page={page_number}&{search_query}"
+
+        cached = self._read_cache(search_query, page_number)
+        if cached is not None:
+            return cached  # No API call was made, so no rate limit token is spent
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self._request(url)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            with self._encoding_lock:  # Worker threads race on the first responses
+                if not self._encoding_logged:
+                    logging.info(f"Candid API response encoding: {response.headers.get('Content-Encoding', 'identity')}")
+                    self._encoding_logged = True
+            grants_data = _loads(response.content)
+        except httpx.HTTPError as e:
             logging.error(f"Error getting grants transactions: {e}")
             raise
 
-    @staticmethod
-    def _build_query_params(page_number: int, year_range: Tuple[Optional[int], Optional[int]],
-                            dollar_range: Tuple[Optional[int], Optional[int]], subjects: List[str],
-                            populations: List[str], locations: List[str], support_strategies: List[str]) -> Dict[
-                            str, str]:
+        self._write_cache(search_query, page_number, response.content)
+        return grants_data
+
+    def _query_cache_dir(self, search_query: str) -> str:
+        key = hashlib.blake2b(f"{self.base_url}?{search_query}".encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def _read_cache(self, search_query: str, page_number: int) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+
+        query_dir = self._query_cache_dir(search_query)
+        try:
+            # Freshness follows page 1, so every cached page of a search comes from the same snapshot
+            if time.time() - os.path.getmtime(os.path.join(query_dir, "1.json")) > self.cache_ttl:
+                return None
+            with open(os.path.join(query_dir, f"{page_number}.json"), "rb") as f:
+                return _loads(f.read())
+        except (OSError, ValueError):
+            return None  # Missing or partially written entries are treated as a cache miss
+
+    def _write_cache(self, search_query: str, page_number: int, content: bytes):
+        if not self.cache_dir:
+            return
+
+        query_dir = self._query_cache_dir(search_query)
+        cache_file = os.path.join(query_dir, f"{page_number}.json")
+        temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(query_dir, exist_ok=True)
+            with open(temp_file, "wb") as f:
+                f.write(content)
+            os.replace(temp_file, cache_file)  # Readers never see a partially written entry
+        except OSError as e:
+            # The cache is best-effort; a failed write must not discard a good API response
+            logging.warning(f"Could not write cache entry {cache_file}: {e}")
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+    def _clear_cache(self, search_query: str):
+        if self.cache_dir:
+            shutil.rmtree(self._query_cache_dir(search_query), ignore_errors=True)
+
+    def probe_search(self, search_query: str) -> Dict[str, Any]:
+        # Runs before fetch_grants, never inside the thread pool. A page 1 cache miss starts a new snapshot of
+        # the results, so pages cached alongside the old page 1 are discarded since rows may have shifted
+        if self._read_cache(search_query, 1) is None:
+            self._clear_cache(search_query)
+        return self.get_grants_transactions(1, search_query)
+
+    def build_search_query(self, year_range: Tuple[Optional[int], Optional[int]],
+                           dollar_range: Tuple[Optional[int], Optional[int]], subjects: List[str],
+                           populations: List[str], locations: List[str], support_strategies: List[str]) -> str:
+        # Everything except the page number is constant for a search, so encode it once and reuse it per page
         start_year, end_year = year_range
         min_amt, max_amt = dollar_range
 
-        params = {
-            "page": page_number,
-            "include_gov": "yes",
-            "sort_by": "year_issued",
-            "sort_order": "desc",
-            "format": "json"
-        }
+        params = {}
 
         if locations:
             params["location"] = ",".join(locations)
             params["geo_id_type"] = "geonameid"
             params["location_type"] = "area_served"
 
-        if year_range != (None, None):
+        # A one-sided range (e.g. [2020, null] from a saved search) means that single year
+        if start_year is not None or end_year is not None:
+            start_year = start_year if start_year is not None else end_year
+            end_year = end_year if end_year is not None else start_year
             params["year"] = ",".join(map(str, range(start_year, end_year + 1)))
 
         if subjects:
@@ -102,38 +300,54 @@ class GrantFetcher:
         if max_amt is not None:
             params["max_amt"] = max_amt
 
-        return params
-
-    def fetch_grants(self, num_pages: int, year_range: Tuple[Optional[int], Optional[int]],
-                     dollar_range: Tuple[Optional[int], Optional[int]], subjects: List[str],
-                     populations: List[str], locations: List[str], support_strategies: List[str]) -> List[
-                    Dict[str, Any]]:
-        all_grants = []
-
-        for page_number in track(range(1, num_pages + 1), description="Fetching grants data"):
-            try:
-                grants_data = self.get_grants_transactions(page_number, year_range, dollar_range, subjects, populations,
-                                                           locations, support_strategies)
+        # Larger pages mean fewer requests against the rate limit; num_pages in the response reflects this
+        if self.per_page:
+            params["per_page"] = self.per_page
+
+        return f"{self._BASE_QUERY}&{urlencode(params)}" if params else self._BASE_QUERY
+
+    def fetch_grants(self, writer: GrantsWriter, num_pages: int, search_query: str,
+                     start_page: int = 1) -> Tuple[int, int]:
+        # Returns (rows written, last page written); the last page falls short of the range when a page failed
+        # Requests start at the rate-limited pace but overlap their network latency
+        page_numbers = range(start_page, start_page + num_pages)
+        page_rows: Dict[int, List[Dict[str, Any]]] = {}
+        next_page = start_page
+        written = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.get_grants_transactions, page_number, search_query): page_number
+                for page_number in page_numbers
+            }
+
+            for future in track(as_completed(futures), total=num_pages, description="Fetching grants data"):
+                page_number = futures[future]
+                try:
+                    grants_data = future.result()
 
-                if "rows" in grants_data["data"]:
-                    all_grants.extend(grants_data["data"]["rows"])
-                else:
-                    logging.info(f"No grants data found on page {page_number}.")
+                    rows = (grants_data.get("data") or {}).get("rows")
+                    if not rows:
+                        logging.info(f"No grants data found on page {page_number}.")
+                    page_rows[page_number] = rows or []
 
-                time.sleep(self.delay)  # Pause for required delay time
+                except Exception as e:
+                    logging.error(f"An error occurred while fetching grants data on page {page_number}: {e}")
+                    for pending in futures:
+                        pending.cancel()
+                    break
 
-            except Exception as e:
-                logging.error(f"An error occurred while fetching grants data on page {page_number}: {e}")
-                break
+                # Flush pages as soon as they can be written in order, keeping only out-of-order pages in memory
+                while next_page in page_rows:
+                    rows = page_rows.pop(next_page)
+                    writer.write_rows(rows)
+                    written += len(rows)
+                    next_page += 1
 
-        return all_grants
+        return written, next_page - 1
 
     @staticmethod
-    def save_grants_to_file(grants: List[Dict[str, Any]], output_prefix: str, page_start: int, page_end: int):
-        output_file = f"{output_prefix}_pages_{page_start}-{page_end}.json"
-        with open(output_file, "w") as f:
-            json.dump({"grants": grants}, f, indent=2)
-        console.print(f"[bold green]Grants data saved to {output_file}[/bold green]")
+    def open_grants_writer(output_prefix: str, append: bool = False) -> GrantsWriter:
+        return GrantsWriter(f"{output_prefix}.jsonl", append=append)
 
 
 def validate_input(value: str, value_type: type, min_value: Optional[int] = None, max_value: Optional[int] = None) -> \
@@ -152,6 +366,20 @@ def validate_input(value: str, value_type: type, min_value: Optional[int] = None
         raise ValueError(f"Invalid input: {e}")
 
 
+def make_validator(value_type: type, min_value: Optional[int] = None, max_value: Optional[int] = None) -> \
+        Callable[[str], Optional[Any]]:
+    # Binds fixed bounds once so call sites reuse a ready-made validator instead of repeating them
+    def validate(value: str) -> Optional[Any]:
+        return validate_input(value, value_type, min_value, max_value)
+
+    return validate
+
+
+validate_year = make_validator(int, min_value=1900, max_value=2100)
+validate_non_negative_int = make_validator(int, min_value=0)
+validate_positive_int = make_validator(int, min_value=1)
+
+
 def get_user_input(prompt: str, default_value: Optional[str] = None) -> str:
     if default_value:
         user_input = Prompt.ask(f"{prompt} (default: {default_value})", default=default_value)
@@ -161,9 +389,11 @@ def get_user_input(prompt: str, default_value: Optional[str] = None) -> str:
 
 
 def display_menu(options: List[str]) -> int:
-    console.print("\n[bold blue]Main Menu[/bold blue]")
-    for idx, option in enumerate(options, 1):
-        console.print(f"[cyan]{idx}. {option}[/cyan]")
+    # Render the whole menu in one print rather than one terminal write per line
+    console.print(Group(
+        "\n[bold blue]Main Menu[/bold blue]",
+        *(f"[cyan]{idx}. {option}[/cyan]" for idx, option in enumerate(options, 1))
+    ))
     while True:
         menu_choice = Prompt.ask("Please select an option", choices=[str(i) for i in range(1, len(options) + 1)])
         return int(menu_choice)
@@ -172,51 +402,214 @@ def display_menu(options: List[str]) -> int:
 def save_search_config(config: Dict[str, Any], search_name: str):
     os.makedirs(SAVED_SEARCHES_DIR, exist_ok=True)
     config_file = os.path.join(SAVED_SEARCHES_DIR, f"{search_name}.json")
-    with open(config_file, "w") as f:
-        json.dump(config, f, indent=2)
+    with open(config_file, "wb") as f:
+        f.write(_dumps(config, indent=True))
     console.print(f"[bold green]Search configuration saved to {config_file}[/bold green]")
 
 
 def load_search_config(search_name: str) -> Dict[str, Any]:
     config_file = os.path.join(SAVED_SEARCHES_DIR, f"{search_name}.json")
-    with open(config_file, "r") as f:
-        config = json.load(f)
+    with open(config_file, "rb") as f:
+        config = _loads(f.read())
     console.print(f"[bold green]Search configuration loaded from {config_file}[/bold green]")
     return config
 
 
+def export_grants_json(output_prefix: str):
+    # GrantScope's uploader reads a single {"grants": [...]} document; rewrap the NDJSON rows without loading them
+    source_file = f"{output_prefix}.jsonl"
+    output_file = f"{output_prefix}.json"
+    with open(source_file, "rb") as source, open(output_file, "wb") as output:
+        output.write(b'{"grants":[')
+        first = True
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            if not first:
+                output.write(b",")
+            output.write(line)
+            first = False
+        output.write(b"]}")
+    console.print(f"[bold green]GrantScope data saved to {output_file}[/bold green]")
+
+
 def display_search_parameters(year_range: Tuple[Optional[int], Optional[int]],
                               dollar_range: Tuple[Optional[int], Optional[int]],
                               subjects: List[str], populations: List[str], locations: List[str],
                               support_strategies: List[str], output_prefix: str):
-    console.print("\n[bold blue]Current Search Parameters:[/bold blue]")
-    console.print(f"Year Range: {year_range[0]} - {year_range[1]}")
-    console.print(f"Dollar Range: {dollar_range[0]} - {dollar_range[1]}")
-    console.print(f"Subjects: {', '.join(subjects)}")
-    console.print(f"Populations: {', '.join(populations)}")
-    console.print(f"Locations: {', '.join(locations)}")
-    console.print(f"Support Strategies: {', '.join(support_strategies)}")
-    console.print(f"Output Prefix: {output_prefix}")
+    console.print(Group(
+        "\n[bold blue]Current Search Parameters:[/bold blue]",
+        f"Year Range: {year_range[0]} - {year_range[1]}",
+        f"Dollar Range: {dollar_range[0]} - {dollar_range[1]}",
+        f"Subjects: {', '.join(subjects)}",
+        f"Populations: {', '.join(populations)}",
+        f"Locations: {', '.join(locations)}",
+        f"Support Strategies: {', '.join(support_strategies)}",
+        f"Output Prefix: {output_prefix}"
+    ))
+
+
+_saved_searches_cache: Dict[str, Any] = {"mtime": None, "searches": []}
 
 
 def get_saved_searches() -> List[str]:
-    search_files = [f for f in os.listdir(SAVED_SEARCHES_DIR) if f.endswith(".json")]
-    return [os.path.splitext(f)[0] for f in search_files]
+    try:
+        mtime = os.stat(SAVED_SEARCHES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    # Only rescan when a search has been added or removed since the last listing
+    if mtime != _saved_searches_cache["mtime"]:
+        with os.scandir(SAVED_SEARCHES_DIR) as entries:
+            searches = [entry.name[:-5] for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+        _saved_searches_cache.update(mtime=mtime, searches=searches)
+    return list(_saved_searches_cache["searches"])
+
+
+def create_grant_fetcher(use_cache: bool = True) -> Optional[GrantFetcher]:
+    api_key = os.getenv("CANDID_API_KEY")
+    if not api_key:
+        console.print("Error: CANDID_API_KEY is not set in the environment variables.", style='red')
+        return None
+
+    try:
+        per_page = validate_positive_int(os.getenv("CANDID_PER_PAGE", ""))
+    except ValueError as e:
+        console.print(f"Error: CANDID_PER_PAGE is not valid. {e}", style='red')
+        return None
+
+    try:
+        cache_ttl = validate_non_negative_int(os.getenv("CANDID_CACHE_TTL", ""))
+    except ValueError as e:
+        console.print(f"Error: CANDID_CACHE_TTL is not valid. {e}", style='red')
+        return None
+    if cache_ttl is None:
+        cache_ttl = CACHE_TTL
+
+    cache_dir = CACHE_DIR if use_cache and cache_ttl else None
+    return GrantFetcher(api_key, per_page=per_page, cache_dir=cache_dir, cache_ttl=cache_ttl)
+
+
+def split_codes(value: Optional[str]) -> List[str]:
+    return [code.strip() for code in value.split(",") if code.strip()] if value else []
 
 
-def main():
+def run_batch(args: argparse.Namespace) -> int:
+    grant_fetcher = create_grant_fetcher(use_cache=not args.no_cache)
+    if grant_fetcher is None:
+        return 1
+
+    try:
+        config = load_search_config(args.search) if args.search else {}
+    except (OSError, ValueError) as e:
+        console.print(f"Error: could not load saved search '{args.search}': {e}", style='red')
+        return 1
+    year_range = tuple(config.get("year_range", (None, None)))
+    dollar_range = tuple(config.get("dollar_range", (None, None)))
+    if args.year_start is not None:
+        year_range = (args.year_start, args.year_end if args.year_end is not None else args.year_start)
+    # Each bound overrides the saved value on its own, so --max-amount alone keeps the saved minimum
+    dollar_range = (args.min_amount if args.min_amount is not None else dollar_range[0],
+                    args.max_amount if args.max_amount is not None else dollar_range[1])
+    if None not in dollar_range and dollar_range[1] < dollar_range[0]:
+        console.print(f"Error: maximum amount {dollar_range[1]} is below the minimum amount {dollar_range[0]}.",
+                      style='red')
+        return 1
+    subjects = split_codes(args.subjects) if args.subjects is not None else config.get("subjects", [])
+    populations = split_codes(args.populations) if args.populations is not None else config.get("populations", [])
+    locations = split_codes(args.locations) if args.locations is not None else config.get("locations", [])
+    support_strategies = split_codes(args.support_strategies) if args.support_strategies is not None else \
+        config.get("support_strategies", [])
+    output_prefix = args.output or config.get("output_prefix") or time.strftime("%Y%m%d_%H%M%S")
+
+    try:
+        search_query = grant_fetcher.build_search_query(year_range, dollar_range, subjects, populations, locations,
+                                                        support_strategies)
+        grants_data = grant_fetcher.probe_search(search_query)
+        data = grants_data.get("data") or {}
+        total_hits = data.get("total_hits", 0)
+        total_pages = data.get("num_pages", 0)
+        console.print(f"Total hits: {total_hits}", style='blue')
+        console.print(f"Total pages: {total_pages}", style='blue')
+        if not total_pages:
+            console.print("No grants found for these search parameters.", style='yellow')
+            return 0
+
+        num_pages = min(args.pages, total_pages) if args.pages else total_pages
+        with grant_fetcher.open_grants_writer(output_prefix) as writer:
+            total_grants, last_page = grant_fetcher.fetch_grants(writer, num_pages, search_query)
+        console.print(f"Total grants fetched: {total_grants}", style='green')
+        if last_page < num_pages:
+            console.print(f"Fetching stopped early; only pages 1-{last_page} of {num_pages} were saved.", style='red')
+            return 1
+        if args.grantscope:
+            export_grants_json(output_prefix)
+    except httpx.HTTPError:
+        console.print("Error connecting to the Candid Server. Please try again later.", style='red')
+        return 1
+    except (OSError, ValueError) as e:
+        # Unwritable output paths, malformed API responses and similar failures end the run cleanly too
+        console.print(f"Error: {e}", style='red')
+        return 1
+
+    return 0
+
+
+def cli() -> int:
+    parser = argparse.ArgumentParser(
+        description="Fetch grants data from the Candid API. Run without arguments for the interactive menu.")
+    parser.add_argument("--search", help="name of a saved search configuration to start from")
+    parser.add_argument("--year-start", help="first year issued (e.g., 2022)")
+    parser.add_argument("--year-end", help="last year issued (default: --year-start)")
+    parser.add_argument("--min-amount", help="minimum dollar amount (e.g., 25000)")
+    parser.add_argument("--max-amount", help="maximum dollar amount (e.g., 10000000)")
+    parser.add_argument("--subjects", help="comma-separated subject codes (e.g., SJ02,SJ05)")
+    parser.add_argument("--populations", help="comma-separated population codes (e.g., PA010000,PC040000)")
+    parser.add_argument("--locations", help="comma-separated geonameids (e.g., 4671654,4736286)")
+    parser.add_argument("--support-strategies", help="comma-separated support strategy codes (e.g., UA,UB)")
+    parser.add_argument("--pages", help="number of pages to fetch (default: all)")
+    parser.add_argument("--output", help="output file prefix (default: current timestamp)")
+    parser.add_argument("--grantscope", action="store_true", default=None,
+                        help="also write <output>.json in the {\"grants\": [...]} format GrantScope uploads")
+    parser.add_argument("--no-cache", action="store_true", help="always query the API instead of the local cache")
+    args = parser.parse_args()
+
+    if args.year_end is not None and args.year_start is None:
+        parser.error("--year-end requires --year-start")
+
+    # Apply the same bounds as the interactive prompts
+    validators = [
+        ("year_start", validate_year),
+        ("year_end", lambda value: validate_input(value, int, min_value=args.year_start, max_value=2100)),
+        ("min_amount", validate_non_negative_int),
+        ("max_amount", lambda value: validate_input(value, int, min_value=args.min_amount or 0)),
+        ("pages", validate_positive_int)
+    ]
+    for name, validate in validators:
+        try:
+            setattr(args, name, validate(getattr(args, name)))
+        except ValueError as e:
+            parser.error(f"--{name.replace('_', '-')}: {e}")
+
+    # Any search argument switches to non-interactive batch mode
+    if any(value is not None for name, value in vars(args).items() if name != "no_cache"):
+        return run_batch(args)
+
+    main(use_cache=not args.no_cache)
+    return 0
+
+
+def main(use_cache: bool = True):
     clear_screen()
     animate_text("Welcome to the Candid API Grants Data Fetcher!", color='green')
     animate_text("This tool will guide you through the process of fetching grants data from the Candid API.", color='green')
     animate_text("Press Enter to skip any field and use the default value (if available) or keep the existing value.", color='green')
 
-    api_key = os.getenv("CANDID_API_KEY")
-    if not api_key:
-        console.print("Error: CANDID_API_KEY is not set in the environment variables.", style='red')
+    grant_fetcher = create_grant_fetcher(use_cache)
+    if grant_fetcher is None:
         return
 
-    grant_fetcher = GrantFetcher(api_key)
-
     year_range = (None, None)
     dollar_range = (None, None)
     subjects = []
@@ -241,13 +634,13 @@ def main():
             if menu_choice == 1:
                 clear_screen()
                 console.print("Enter the start year (e.g., 2022)", style="green")
-                start_year = validate_input(Prompt.ask("", default=str(year_range[0]) if year_range[0] else "", show_default=False), int, min_value=1900, max_value=2100)
+                start_year = validate_year(Prompt.ask("", default=str(year_range[0]) if year_range[0] else "", show_default=False))
                 console.print("Enter the end year (e.g., 2023)", style="green")
                 end_year = validate_input(Prompt.ask("", default=str(year_range[1]) if year_range[1] else "", show_default=False), int, min_value=start_year, max_value=2100) if start_year else None
                 year_range = (start_year, end_year)
 
                 console.print("Enter the minimum dollar amount (e.g., 25000)", style="green")
-                min_amt = validate_input(Prompt.ask("", default=str(dollar_range[0]) if dollar_range[0] else "", show_default=False), int, min_value=0)
+                min_amt = validate_non_negative_int(Prompt.ask("", default=str(dollar_range[0]) if dollar_range[0] else "", show_default=False))
                 console.print("Enter the maximum dollar amount (e.g., 10000000)", style="green")
                 max_amt = validate_input(Prompt.ask("", default=str(dollar_range[1]) if dollar_range[1] else "", show_default=False), int, min_value=min_amt) if min_amt else None
                 dollar_range = (min_amt, max_amt)
@@ -280,34 +673,48 @@ def main():
                 clear_screen()
                 animate_text("Contacting the Candid Server...", color='yellow')
                 try:
-                    grants_data = grant_fetcher.get_grants_transactions(1, year_range, dollar_range, subjects, populations, locations, support_strategies)
+                    search_query = grant_fetcher.build_search_query(year_range, dollar_range, subjects, populations, locations, support_strategies)
+                    grants_data = grant_fetcher.probe_search(search_query)
                     animate_text("Connection Established! Gathering Results...", color='green')
-                    total_hits = grants_data["data"]["total_hits"]
-                    total_pages = grants_data["data"]["num_pages"]
+                    data = grants_data.get("data") or {}
+                    total_hits = data.get("total_hits", 0)
+                    total_pages = data.get("num_pages", 0)
                     console.print(f"Total hits: {total_hits}", style='blue')
                     console.print(f"Total pages: {total_pages}", style='blue')
+                    if not total_pages:
+                        console.print("No grants found for these search parameters.", style='yellow')
+                        continue
 
                     console.print("Enter the number of pages to fetch", style="green")
                     num_pages = validate_input(Prompt.ask("", default="10", show_default=False), int, min_value=1, max_value=total_pages)
 
-                    grants = grant_fetcher.fetch_grants(num_pages, year_range, dollar_range, subjects, populations, locations, support_strategies)
-                    grant_fetcher.save_grants_to_file(grants, output_prefix, 1, num_pages)
-                    console.print(f"Total grants fetched: {len(grants)}", style='green')
+                    with grant_fetcher.open_grants_writer(output_prefix) as writer:
+                        total_grants, last_page = grant_fetcher.fetch_grants(writer, num_pages, search_query)
+                    console.print(f"Total grants fetched: {total_grants}", style='green')
+                    if last_page < num_pages:
+                        console.print(f"Fetching stopped early; pages 1-{last_page} were saved.", style='yellow')
 
                     console.print("Do you want to fetch more pages? (Y/N)", style="green")
                     continue_choice = Prompt.ask("", default="N", show_default=False)
                     if continue_choice.upper() == "Y":
-                        remaining_pages = total_pages - num_pages
+                        remaining_pages = total_pages - last_page
                         if remaining_pages > 0:
                             console.print(f"Enter the number of additional pages to fetch (max {remaining_pages})", style="green")
                             additional_pages = validate_input(Prompt.ask("", default=str(remaining_pages), show_default=False), int, min_value=1, max_value=remaining_pages)
-                            additional_grants = grant_fetcher.fetch_grants(additional_pages, year_range, dollar_range, subjects, populations, locations, support_strategies)
-                            grants.extend(additional_grants)
-                            grant_fetcher.save_grants_to_file(grants, output_prefix, num_pages + 1, num_pages + additional_pages)
-                            console.print(f"Total grants fetched: {len(grants)}", style='green')
+                            with grant_fetcher.open_grants_writer(output_prefix, append=True) as writer:
+                                additional_grants, new_last_page = grant_fetcher.fetch_grants(writer, additional_pages, search_query, start_page=last_page + 1)
+                            total_grants += additional_grants
+                            console.print(f"Total grants fetched: {total_grants}", style='green')
+                            if new_last_page < last_page + additional_pages:
+                                console.print(f"Fetching stopped early; pages 1-{new_last_page} were saved.", style='yellow')
                         else:
                             console.print("No more pages available to fetch.", style='yellow')
-                except requests.exceptions.RequestException:
+
+                    console.print("Also save a GrantScope-compatible JSON file? (Y/N)", style="green")
+                    export_choice = Prompt.ask("", default="N", show_default=False)
+                    if export_choice.upper() == "Y":
+                        export_grants_json(output_prefix)
+                except httpx.HTTPError:
                     animate_text("Error connecting to the Candid Server. Please try again later.", color='red')
 
             elif menu_choice == 4:
@@ -329,9 +736,10 @@ def main():
                 clear_screen()
                 saved_searches = get_saved_searches()
                 if saved_searches:
-                    console.print("Saved Searches:", style='blue')
-                    for idx, search_name in enumerate(saved_searches, 1):
-                        console.print(f"{idx}. {search_name}", style='cyan')
+                    console.print(Group(
+                        "[blue]Saved Searches:[/blue]",
+                        *(f"[cyan]{idx}. {search_name}[/cyan]" for idx, search_name in enumerate(saved_searches, 1))
+                    ))
                     search_choice = int(Prompt.ask("Please select a search configuration", choices=[str(i) for i in range(1, len(saved_searches) + 1)]))
                     selected_search = saved_searches[search_choice - 1]
                     search_config = load_search_config(selected_search)
@@ -356,4 +764,4 @@ def main():
             console.print(f"An error occurred: {e}", style='red')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file